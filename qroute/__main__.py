@@ -1,6 +1,7 @@
 import os
 import logging
 import argparse
+import concurrent.futures
 
 import wandb
 import torch
@@ -17,6 +18,20 @@ from .visualizers.greedy_schedulers import cirq_routing, qiskit_routing, tket_ro
 logging.basicConfig(level=logging.DEBUG)
 
 
+def print_routing_distances(circuit, device, routers):
+    """
+    Benchmarks the baseline routers on the same circuit concurrently, since they
+    are independent of each other, and prints the resulting routing distances
+    :param circuit: the input logical circuit to route
+    :param device: the device to compile the circuit on
+    :param routers: list of (name, routing function) pairs to run
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(routers)) as executor:
+        futures = [executor.submit(router, circuit, device) for _name, router in routers]
+        for (name, _router), future in zip(routers, futures):
+            print("%s Routing Distance: " % name, future.result())
+
+
 if __name__ == '__main__':
 
     parser = argparse.ArgumentParser(description='Process some integers.')
@@ -34,6 +49,8 @@ if __name__ == '__main__':
                         help='Whether to use WandB to log the results of experiments.')
     parser.add_argument('--search', default=200, type=int,
                         help='Number of iterations to search for before making a move.')
+    parser.add_argument('--jobs', default=1, type=int,
+                        help='Number of processes to split the MCTS search across.')
     args = parser.parse_args()
 
     # Get the right environment up
@@ -52,7 +69,7 @@ if __name__ == '__main__':
     # Get the agent up and ready
     model = GraphDualModel(device, True)
     memory = MemorySimple(0)
-    agent = MCTSAgent(model, device, memory, search_depth=args.search)
+    agent = MCTSAgent(model, device, memory, search_depth=args.search, n_jobs=args.jobs)
 
     # Other preferences
     if args.wandb:
@@ -72,9 +89,9 @@ if __name__ == '__main__':
             circuit = CircuitRepDQN(cirq, len(device))
             train_step(agent, device, circuit, episode_name=file, use_wandb=args.wandb, train_model=args.train)
             print("Layers in input circuit: ", len(cirq.moments))
-            print("Cirq Routing Distance: ", cirq_routing(circuit, device))
-            print("Qiskit Routing Distance: ", qiskit_routing(circuit, device))
-            print("PyTket Routing Distance: ", tket_routing(circuit, device))
+            print_routing_distances(circuit, device, [("Cirq", cirq_routing),
+                                                      ("Qiskit", qiskit_routing),
+                                                      ("PyTket", tket_routing)])
     elif args.dataset == "large":
         large_files = ["rd84_142", "adr4_197", "radd_250", "z4_268", "sym6_145", "misex1_241",
                        "rd73_252", "cycle10_2_110", "square_root_7", "sqn_258", "rd84_253"]
@@ -84,23 +101,23 @@ if __name__ == '__main__':
             print(len(list(cirq.all_qubits())))
             circuit = CircuitRepDQN(cirq, len(device))
             train_step(agent, device, circuit, episode_name=file, use_wandb=args.wandb, train_model=args.train)
-            print("Qiskit Routing Distance: ", qiskit_routing(circuit, device))
-            print("PyTket Routing Distance: ", tket_routing(circuit, device))
+            print_routing_distances(circuit, device, [("Qiskit", qiskit_routing),
+                                                      ("PyTket", tket_routing)])
     elif args.dataset == "random":
         for e in range(args.iterations):
             cirq = circuit_generated_randomly(len(device), args.gates)
             circuit = CircuitRepDQN(cirq, len(device))
             print("Layers in input circuit: ", len(cirq.moments))
             train_step(agent, device, circuit, episode_name=f"random_{e}", use_wandb=args.wandb, train_model=args.train)
-            print("Cirq Routing Distance: ", cirq_routing(circuit, device))
-            print("Qiskit Routing Distance: ", qiskit_routing(circuit, device))
-            print("PyTket Routing Distance: ", tket_routing(circuit, device))
+            print_routing_distances(circuit, device, [("Cirq", cirq_routing),
+                                                      ("Qiskit", qiskit_routing),
+                                                      ("PyTket", tket_routing)])
     elif args.dataset == "full":
         for e in range(args.iterations):
             cirq = circuit_generated_full_layer(len(device), args.gates)
             circuit = CircuitRepDQN(cirq, len(device))
             print("Layers in input circuit: ", len(cirq.moments))
             train_step(agent, device, circuit, episode_name=f"full_{e}", use_wandb=args.wandb, train_model=args.train)
-            print("Cirq Routing Distance: ", cirq_routing(circuit, device))
-            print("Qiskit Routing Distance: ", qiskit_routing(circuit, device))
-            print("PyTket Routing Distance: ", tket_routing(circuit, device))
+            print_routing_distances(circuit, device, [("Cirq", cirq_routing),
+                                                      ("Qiskit", qiskit_routing),
+                                                      ("PyTket", tket_routing)])
@@ -6,6 +6,8 @@ CREDITS : Thomas Moerland, Delft University of Technology
 import copy
 import typing as ty
 import collections
+import concurrent.futures
+import multiprocessing
 
 import numpy as np
 import torch
@@ -13,10 +15,46 @@ import torch
 from ..metas import CombinerAgent
 from ..environment.state import CircuitStateDQN
 from ..environment.env import step, evaluate
+from ..models.graph_dual import GraphDualModel
 
 MemoryItem = collections.namedtuple('MemoryItem', ['state', 'reward', 'action', 'next_state', 'done'])
 
 
+def _amp_autocast():
+    """
+    Autocast context for search-time inference: the value/policy network runs in
+    bfloat16 on CUDA devices, and this is a no-op on CPU where the forward pass
+    does not benefit from reduced precision.
+    """
+    return torch.autocast(device_type='cuda', dtype=torch.bfloat16, enabled=torch.cuda.is_available())
+
+
+def _root_parallel_worker(device, model_state, stop_move, state, solution, seed, n_mcts, leaf_batch_size):
+    """
+    Runs one shard of the MCTS search in a worker process. Only the circuit state
+    and the model weights cross the process boundary; the worker builds its own
+    model, agent and tree from them, so no live tensors are ever shared with (or
+    mutated under) the parent's search.
+    :param device: DeviceTopology, the device the circuit is being routed on
+    :param model_state: dict, CPU state_dict snapshot of the search model
+    :param stop_move: bool, whether the model's policy head has the commit action
+    :param state: CircuitStateDQN, the state at the root of the search
+    :param solution: np.array, the partial solution at the root of the search
+    :param seed: int, seed for this worker so the shards explore differently
+    :param n_mcts: int, number of simulations to run in this shard
+    :param leaf_batch_size: int, number of leaves to evaluate per forward pass
+    :return: (n_value, q_value) numpy arrays of the worker's root after searching
+    """
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+    model = GraphDualModel(device, stop_move)
+    model.load_state_dict(model_state)
+    agent = MCTSAgent(model, device, None, search_depth=n_mcts, leaf_batch_size=leaf_batch_size)
+    agent.root = MCTSAgent.MCTSState(state, model, solution=solution)
+    agent.search(n_mcts)
+    return agent.root.n_value.numpy(), agent.root.q_value.numpy()
+
+
 class MCTSAgent(CombinerAgent):
 
     class MCTSState:
@@ -27,7 +65,8 @@ class MCTSAgent(CombinerAgent):
         HYPERPARAM_NOISE_ALPHA = 0.2
         HYPERPARAM_PRIOR_FRACTION = 0.25
 
-        def __init__(self, state, model, solution=None, r_previous=0, parent_state=None, parent_action=None):
+        def __init__(self, state, model, solution=None, r_previous=0, parent_state=None, parent_action=None,
+                     defer_evaluation=False):
             """
             Initialize a new state
             """
@@ -39,7 +78,11 @@ class MCTSAgent(CombinerAgent):
             self.solution: np.ndarray = copy.copy(solution) if solution is not None else \
                 np.full(self.num_actions, False)
 
-            self.rollout_reward = self.rollout() if self.parent_action is not None else 0.0
+            self.rollout_reward = 0.0
+            self._rollout_state = None
+            if self.parent_action is not None:
+                assert not np.any(np.bitwise_and(self.state.locked_edges, self.solution)), "Bad Action"
+                self._rollout_state, _, _, _ = step(self.solution, self.state)
             self.action_mask = np.concatenate([state.device.swappable_edges(
                 self.solution, self.state.locked_edges, self.state.target_nodes == -1),
                 np.array([solution is not None or np.any(self.state.locked_edges)])])
@@ -48,14 +91,42 @@ class MCTSAgent(CombinerAgent):
             self.q_value = torch.zeros(self.num_actions + 1)
             self.child_states: ty.List[ty.Optional[MCTSAgent.MCTSState]] = [None for _ in range(self.num_actions + 1)]
 
-            model.eval()
-            with torch.no_grad():
-                _value, self.priors = self.model(self.state)
-                self.priors = self.priors.detach().numpy()
-                self.priors += np.bitwise_not(self.action_mask) * -1e8
-                self.priors = torch.flatten(torch.tensor(self.priors))
-            noise = np.random.dirichlet([self.HYPERPARAM_NOISE_ALPHA for _ in self.priors]) * self.action_mask
-            self.priors = self.HYPERPARAM_PRIOR_FRACTION * self.priors + (1 - self.HYPERPARAM_PRIOR_FRACTION) * noise
+            self.priors = None
+            if not defer_evaluation:
+                with torch.inference_mode(), _amp_autocast():
+                    outputs = [self.model(evaluation_state) for evaluation_state in self.states_to_evaluate]
+                self.evaluate(*outputs)
+
+        @property
+        def evaluated(self):
+            """
+            True once the model outputs have been folded into this node
+            """
+            return self.priors is not None
+
+        @property
+        def states_to_evaluate(self):
+            """
+            The circuit states whose model outputs this node needs, the node's own
+            state for the priors and the stepped state for the rollout reward
+            :return: list of CircuitStateDQN objects to run the model on
+            """
+            return [self.state] if self._rollout_state is None else [self.state, self._rollout_state]
+
+        def evaluate(self, state_output, rollout_output=None):
+            """
+            Finishes initializing the node from the model outputs for its states,
+            so the forward passes can be batched across several leaves
+            :param state_output: (value, priors) output of the model on the node's state
+            :param rollout_output: (value, priors) output of the model on the stepped state
+            """
+            if rollout_output is not None:
+                self.rollout_reward = rollout_output[0].item()
+            priors = state_output[1].detach().numpy()
+            priors = priors + np.bitwise_not(self.action_mask) * -1e8
+            priors = torch.flatten(torch.tensor(priors))
+            noise = np.random.dirichlet([self.HYPERPARAM_NOISE_ALPHA for _ in priors]) * self.action_mask
+            self.priors = self.HYPERPARAM_PRIOR_FRACTION * priors + (1 - self.HYPERPARAM_PRIOR_FRACTION) * noise
 
         def update_q(self, reward, index):
             """
@@ -98,10 +169,8 @@ class MCTSAgent(CombinerAgent):
             returns: mean across the R random rollouts.
             """
             if num_rollouts is None:
-                assert not np.any(np.bitwise_and(self.state.locked_edges, self.solution)), "Bad Action"
-                next_state, _, _, _ = step(self.solution, self.state)
-                with torch.no_grad():
-                    self.model.eval()
+                next_state = self._rollout_state if self._rollout_state is not None else self.state
+                with torch.inference_mode(), _amp_autocast():
                     self.rollout_reward, _priors = self.model(next_state)
                 return self.rollout_reward.item()
             else:
@@ -130,62 +199,148 @@ class MCTSAgent(CombinerAgent):
     HYPERPARAM_DISCOUNT_FACTOR = 0.95
     HYPERPARAM_EXPLORE_C = 100
     HYPERPARAM_POLICY_TEMPERATURE = 0
+    HYPERPARAM_VIRTUAL_LOSS = 1
 
-    def __init__(self, model, device, memory, search_depth=100):
+    def __init__(self, model, device, memory, search_depth=100, n_jobs=1, leaf_batch_size=8):
         super().__init__(model, device)
         self.model = model
         self.root: ty.Optional[MCTSAgent.MCTSState] = None
         self.memory = memory
         self.search_depth = search_depth
+        self.n_jobs = n_jobs
+        self.leaf_batch_size = leaf_batch_size
+        self.model.eval()  # the search only runs inference, replay flips this as needed
+        # One long-lived worker pool for the whole agent: forking a fresh executor
+        # inside every search round, after torch has spun up its own threads, is a
+        # known deadlock source, so the workers are spawned once up front instead
+        self._worker_pool = None
+        if self.n_jobs > 1:
+            context = multiprocessing.get_context('fork')
+            self._worker_pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.n_jobs - 1, mp_context=context)
+            concurrent.futures.wait([self._worker_pool.submit(int, 0) for _ in range(self.n_jobs - 1)])
 
     def search(self, n_mcts):
-        """Perform the MCTS search from the root"""
+        """
+        Perform the MCTS search from the root. Leaves are collected in batches of up
+        to leaf_batch_size by running the selection stage under a virtual loss, then
+        all their model evaluations happen in a single batched forward pass.
+        """
         max_depth, mean_depth = 0, 0
-
-        for _ in range(n_mcts):
-            mcts_state: MCTSAgent.MCTSState = self.root  # reset to root for new trace
-            # input(str(self.root.n_value) + " " + str(self.root.q_value))  # To Debug the tree
-            depth = 0
-
-            while True:
-                depth += 1
-                action_index: int = mcts_state.select()
-
-                if mcts_state.child_states[action_index] is not None:
-                    # MCTS Algorithm: SELECT STAGE
-                    mcts_state = mcts_state.child_states[action_index]
-                    continue
-                elif mcts_state.state.is_done():
-                    break
-                else:
-                    # MCTS Algorithm: EXPAND STAGE
-                    if action_index == len(mcts_state.solution):  # This is a commit action
-                        next_state, _reward, _done, _debug = step(mcts_state.solution, mcts_state.state)
-                        mcts_state.child_states[action_index] = MCTSAgent.MCTSState(
-                            next_state, self.model,
-                            r_previous=0, parent_state=mcts_state, parent_action=action_index)
-                    else:  # This is a swap action
-                        next_solution = np.copy(mcts_state.solution)
-                        next_solution[action_index] = True
-                        reward = evaluate(next_solution, mcts_state.state) - \
-                                 evaluate(mcts_state.solution, mcts_state.state)
-                        mcts_state.child_states[action_index] = MCTSAgent.MCTSState(
-                            mcts_state.state, self.model, next_solution, reward, mcts_state, action_index)
-                    mcts_state = mcts_state.child_states[action_index]
+        simulations_run = 0
+
+        while simulations_run < n_mcts:
+            batch_target = min(self.leaf_batch_size, n_mcts - simulations_run)
+            leaves: ty.List[MCTSAgent.MCTSState] = []
+
+            while len(leaves) < batch_target:
+                mcts_state: MCTSAgent.MCTSState = self.root  # reset to root for new trace
+                # input(str(self.root.n_value) + " " + str(self.root.q_value))  # To Debug the tree
+                depth = 0
+                collision = False
+
+                while True:
+                    depth += 1
+                    action_index: int = mcts_state.select()
+
+                    if mcts_state.child_states[action_index] is not None:
+                        # MCTS Algorithm: SELECT STAGE
+                        # Virtual loss, so the next traces in this batch take other paths
+                        mcts_state.n_value[action_index] += self.HYPERPARAM_VIRTUAL_LOSS
+                        mcts_state = mcts_state.child_states[action_index]
+                        if not mcts_state.evaluated:
+                            collision = True  # reached a leaf already pending evaluation
+                            break
+                        continue
+                    elif mcts_state.state.is_done():
+                        break
+                    else:
+                        # MCTS Algorithm: EXPAND STAGE
+                        mcts_state.n_value[action_index] += self.HYPERPARAM_VIRTUAL_LOSS
+                        if action_index == len(mcts_state.solution):  # This is a commit action
+                            next_state, _reward, _done, _debug = step(mcts_state.solution, mcts_state.state)
+                            mcts_state.child_states[action_index] = MCTSAgent.MCTSState(
+                                next_state, self.model,
+                                r_previous=0, parent_state=mcts_state, parent_action=action_index,
+                                defer_evaluation=True)
+                        else:  # This is a swap action
+                            next_solution = np.copy(mcts_state.solution)
+                            next_solution[action_index] = True
+                            reward = evaluate(next_solution, mcts_state.state) - \
+                                     evaluate(mcts_state.solution, mcts_state.state)
+                            mcts_state.child_states[action_index] = MCTSAgent.MCTSState(
+                                mcts_state.state, self.model, next_solution, reward, mcts_state, action_index,
+                                defer_evaluation=True)
+                        mcts_state = mcts_state.child_states[action_index]
+                        break
+
+                if collision:
+                    # Undo this trace's virtual losses and evaluate what we have so far
+                    self._remove_virtual_loss(mcts_state)
                     break
 
-            # MCTS Algorithm: BACKUP STAGE
-            total_reward = mcts_state.rollout_reward
-            while mcts_state.parent_action is not None:
-                total_reward = mcts_state.r_previous + self.HYPERPARAM_DISCOUNT_FACTOR * total_reward
-                mcts_state.parent_state.update_q(total_reward, mcts_state.parent_action)
-                mcts_state = mcts_state.parent_state
+                leaves.append(mcts_state)
+                max_depth = max(max_depth, depth)
+                mean_depth += depth / n_mcts
+
+            # MCTS Algorithm: batched EVALUATE STAGE
+            pending = [leaf for leaf in leaves if not leaf.evaluated]
+            if len(pending) > 0:
+                with torch.inference_mode(), _amp_autocast():
+                    states = [state for leaf in pending for state in leaf.states_to_evaluate]
+                    outputs = self.model.forward_batch(states)
+                for leaf in pending:
+                    n_outputs = len(leaf.states_to_evaluate)
+                    leaf.evaluate(*outputs[:n_outputs])
+                    outputs = outputs[n_outputs:]
 
-            max_depth = max(max_depth, depth)
-            mean_depth += depth / n_mcts
+            # MCTS Algorithm: BACKUP STAGE
+            for leaf in leaves:
+                self._remove_virtual_loss(leaf)
+            for leaf in leaves:
+                mcts_state = leaf
+                total_reward = mcts_state.rollout_reward
+                while mcts_state.parent_action is not None:
+                    total_reward = mcts_state.r_previous + self.HYPERPARAM_DISCOUNT_FACTOR * total_reward
+                    mcts_state.parent_state.update_q(total_reward, mcts_state.parent_action)
+                    mcts_state = mcts_state.parent_state
+
+            simulations_run += len(leaves)
 
         return max_depth, mean_depth
 
+    def _remove_virtual_loss(self, mcts_state):
+        """Removes the virtual loss applied along the path from the root to this node"""
+        while mcts_state.parent_action is not None:
+            mcts_state.parent_state.n_value[mcts_state.parent_action] -= self.HYPERPARAM_VIRTUAL_LOSS
+            mcts_state = mcts_state.parent_state
+
+    def search_parallel(self, n_mcts):
+        """
+        Root-parallel MCTS: each worker process runs a shard of the simulations on
+        a tree of its own, built fresh over the root's circuit state and a snapshot
+        of the model weights, with its own random seed. The workers hand back plain
+        visit count and q-value arrays for their roots, which are merged into the
+        main root. The main process runs its own shard too, so the tree below the
+        root keeps growing for the later action selection and tree reuse.
+        """
+        n_shard = max(1, n_mcts // self.n_jobs)
+        model_state = {key: value.detach().cpu().clone() for key, value in self.model.state_dict().items()}
+        solution = np.copy(self.root.solution) if np.any(self.root.solution) else None
+        seeds = np.random.randint(2 ** 31 - 1, size=self.n_jobs - 1)
+        futures = [self._worker_pool.submit(
+            _root_parallel_worker, self.device, model_state, self.model.stop_move,
+            self.root.state, solution, int(seed), n_shard, self.leaf_batch_size) for seed in seeds]
+        self.search(n_shard)
+        for future in futures:
+            worker_n, worker_q = future.result()
+            worker_n, worker_q = torch.from_numpy(worker_n), torch.from_numpy(worker_q)
+            merged_n = self.root.n_value + worker_n
+            merged_w = self.root.q_value * self.root.n_value + worker_q * worker_n
+            self.root.q_value = torch.where(
+                merged_n > 0, merged_w / torch.clamp(merged_n, min=1), self.root.q_value)
+            self.root.n_value = merged_n
+
     @staticmethod
     def _stable_normalizer(x, temp=1.5):
         x = (x / torch.max(x)) ** temp
@@ -200,7 +355,10 @@ class MCTSAgent(CombinerAgent):
             self.root.parent_action = None
 
         while True:
-            self.search(self.search_depth)
+            if self.n_jobs > 1:
+                self.search_parallel(self.search_depth)
+            else:
+                self.search(self.search_depth)
             self.memory.store(state,
                               torch.sum((self.root.n_value / torch.sum(self.root.n_value)) * self.root.q_value),
                               self._stable_normalizer(self.root.n_value))
@@ -222,4 +380,5 @@ class MCTSAgent(CombinerAgent):
             value_losses.append(loss_v)
             policy_losses.append(loss_p)
         self.memory.clear()
+        self.model.eval()
         return np.mean(value_losses), np.mean(policy_losses)
@@ -12,6 +12,51 @@ from ..environment.env import step
 from ..visualizers.solution_validator import check_valid_solution
 from ..metas import CombinerAgent
 
+try:
+    from numba import njit
+except ImportError:  # numba is an optional speedup, the kernel runs fine un-jitted
+    def njit(*_args, **_kwargs):
+        def wrap(func):
+            return func
+        return wrap
+
+
+@njit(cache=True)
+def _propose_neighbour_batch(current_solution, edges_n1, edges_n2, n_nodes, batch_size):
+    """
+    Generates a batch of valid neighbour solutions, each being the current solution
+    with one additional free edge swapped in, without re-validating each candidate.
+
+    :param current_solution: boolean array of edges being swapped in the current solution
+    :param edges_n1: int array, first node of each edge on the device
+    :param edges_n2: int array, second node of each edge on the device
+    :param n_nodes: int, number of nodes on the device
+    :param batch_size: int, number of neighbour candidates to generate
+    :return: (candidates, n_available), boolean array of shape (batch_size, n_edges)
+             and the number of edges that were free to swap (0 if none)
+    """
+    n_edges = len(edges_n1)
+    node_in_use = np.zeros(n_nodes, dtype=np.bool_)
+    for e in range(n_edges):
+        if current_solution[e]:
+            node_in_use[edges_n1[e]] = True
+            node_in_use[edges_n2[e]] = True
+    available_edges = np.empty(n_edges, dtype=np.int64)
+    n_available = 0
+    for e in range(n_edges):
+        if not current_solution[e] and not node_in_use[edges_n1[e]] and not node_in_use[edges_n2[e]]:
+            available_edges[n_available] = e
+            n_available += 1
+    candidates = np.empty((batch_size, n_edges), dtype=np.bool_)
+    if n_available == 0:
+        return candidates, 0
+    for k in range(batch_size):
+        edge_to_swap = available_edges[np.random.randint(n_available)]
+        for e in range(n_edges):
+            candidates[k, e] = current_solution[e]
+        candidates[k, edge_to_swap] = True
+    return candidates, n_available
+
 
 class AnnealerDQN(CombinerAgent):
     """
@@ -29,9 +74,24 @@ class AnnealerDQN(CombinerAgent):
         self.initial_temperature = 60.0
         self.min_temperature = 0.1
         self.cooling_multiplier = 0.95
+        self.neighbour_batch_size = 8
+        self._scratch_states = []
+        self._rng = np.random.default_rng()
 
         self.reversed_gates_deque = deque(maxlen=20)
 
+    def _scratch_state(self, index, template_state):
+        """
+        Returns a reusable preallocated state object, so the annealing loop does not
+        allocate a fresh set of state arrays on every energy evaluation.
+        :param index: int, which scratch slot to fetch
+        :param template_state: State, used to allocate new slots the first time around
+        :return: State, the scratch state (contents are stale until overwritten)
+        """
+        while len(self._scratch_states) <= index:
+            self._scratch_states.append(copy.copy(template_state))
+        return self._scratch_states[index]
+
     def get_neighbour_solution(self, current_solution, current_state: CircuitStateDQN):
         """
         Get a solution neighboring current, that is one swap inserted
@@ -40,12 +100,12 @@ class AnnealerDQN(CombinerAgent):
         :return: list, neighbor solution
         """
         neighbour_solution = copy.copy(current_solution)
-        available_edges = current_state.device.swappable_edges(neighbour_solution)
+        available_edges = np.flatnonzero(current_state.device.swappable_edges(neighbour_solution))
 
-        if available_edges is None or len(available_edges) == 0:
+        if len(available_edges) == 0:
             raise RuntimeError("Ran out of edges to swap")
 
-        edge_index_to_swap = np.random.choice(available_edges, 1)
+        edge_index_to_swap = available_edges[self._rng.integers(len(available_edges))]
         neighbour_solution[edge_index_to_swap] = (neighbour_solution[edge_index_to_swap] + 1) % 2
 
         check_valid_solution(neighbour_solution, self.device)
@@ -61,10 +121,25 @@ class AnnealerDQN(CombinerAgent):
                                     if target, then the target model is used.
         :return: int or float, the energy value
         """
-        next_state_temp, _, _, _ = step(solution, current_state)
+        next_state_temp, _, _, _ = step(solution, current_state, out=self._scratch_state(0, current_state))
         q_val = self.model(current_state, next_state_temp, action_chooser)
         return -q_val.detach()
 
+    def get_energy_batch(self, solutions, current_state, action_chooser='model'):
+        """
+        Returns the energy function (negative value function) for a batch of candidate
+        solutions using a single forward pass through the model.
+        :param solutions: list of solutions, each a boolean array of edges to swap
+        :param current_state: State, the state at the current moment (q_locations, q_targets, protected_nodes, ...)
+        :param action_chooser: str, if model, the current model is used to compute the value function,
+                                    if target, then the target model is used.
+        :return: torch.Tensor of shape (len(solutions),), the energy values
+        """
+        next_states = [step(solution, current_state, out=self._scratch_state(i, current_state))[0]
+                       for i, solution in enumerate(solutions)]
+        q_vals = self.model(current_state, next_states, action_chooser)
+        return -q_vals.detach().flatten()
+
     @staticmethod
     def acceptance_probability(current_energy, new_energy, temperature):
         """
@@ -92,11 +167,9 @@ class AnnealerDQN(CombinerAgent):
         :param search_limit: int, max iterations to search for
         :return: best_solution, value of best_energy
         """
-        import qroute
-        temp_state: qroute.environment.state.CircuitStateDQN = copy.copy(current_state)
+        temp_state: CircuitStateDQN = current_state.copy_into(self._scratch_state(0, current_state))
         current_solution = self.generate_initial_solution(current_state)
-        new_state: qroute.environment.state.CircuitStateDQN = copy.copy(current_state)
-        assert temp_state == new_state, "State not preserved when selecting action"
+        assert temp_state == current_state, "State not preserved when selecting action"
 
         if np.all(current_solution == 0):
             # There are no actions possible often happens when only one gate is left, and it's already been scheduled
@@ -117,24 +190,39 @@ class AnnealerDQN(CombinerAgent):
             if search_limit is not None and iterations > search_limit:
                 break
 
-            new_solution = self.get_neighbour_solution(current_solution, current_state)
-            new_energy = self.get_energy(new_solution, current_state=current_state, action_chooser=action_chooser)
-            accept_prob = self.acceptance_probability(current_energy, new_energy, temp)
-
-            if accept_prob > np.random.random():
-                current_solution = new_solution
-                current_energy = new_energy
-
-                # Save best solution, so it can be returned if algorithm terminates at a sub-optimal solution
-                if current_energy < best_energy:
-                    best_solution = copy.copy(current_solution)
-                    best_energy = current_energy
-                    # intervals.append(iterations_since_best)
-                    iterations_since_best = 0
-
-            temp = temp * self.cooling_multiplier
-            iterations_since_best += 1
-            iterations += 1
+            # Propose a batch of neighbours of the current solution and get all their
+            # energies with one model call, instead of one forward pass per iteration
+            new_solutions, n_available = _propose_neighbour_batch(
+                current_solution, self.device.edges_n1, self.device.edges_n2,
+                len(self.device), self.neighbour_batch_size)
+            if n_available == 0:
+                raise RuntimeError("Ran out of edges to swap")
+            new_energies = self.get_energy_batch(list(new_solutions), current_state, action_chooser=action_chooser)
+            accept_rands = self._rng.random(self.neighbour_batch_size)
+
+            for new_solution, new_energy, accept_rand in zip(new_solutions, new_energies, accept_rands):
+                accept_prob = self.acceptance_probability(current_energy, new_energy, temp)
+                accepted = accept_prob > accept_rand
+
+                if accepted:
+                    current_solution = new_solution
+                    current_energy = new_energy
+
+                    # Save best solution, so it can be returned if algorithm terminates at a sub-optimal solution
+                    if current_energy < best_energy:
+                        best_solution = copy.copy(current_solution)
+                        best_energy = current_energy
+                        # intervals.append(iterations_since_best)
+                        iterations_since_best = 0
+
+                temp = temp * self.cooling_multiplier
+                iterations_since_best += 1
+                iterations += 1
+
+                # The remaining candidates neighbour the old solution, so regenerate the batch
+                if accepted or temp <= self.min_temperature or \
+                        (search_limit is not None and iterations > search_limit):
+                    break
 
         return best_solution, best_energy
 
@@ -145,11 +233,11 @@ class AnnealerDQN(CombinerAgent):
         :param current_state: State, the current state of mapping and progress
         :return: list, initial solution as boolean array of whether to swap each node
         """
-        initial_solution = np.zeros(len(self.device.edges))
-        available_edges = current_state.device.swappable_edges(initial_solution)
-        if available_edges is None or len(available_edges) == 0:
+        initial_solution = np.full(len(self.device.edges), False)
+        available_edges = np.flatnonzero(current_state.device.swappable_edges(initial_solution))
+        if len(available_edges) == 0:
             return initial_solution
 
-        edge_index_to_swap = np.random.choice(available_edges)
+        edge_index_to_swap = available_edges[self._rng.integers(len(available_edges))]
         initial_solution[edge_index_to_swap] = (initial_solution[edge_index_to_swap] + 1) % 2
         return initial_solution
@@ -1,4 +1,6 @@
 import os
+import threading
+import concurrent.futures
 
 import numpy as np
 import tqdm
@@ -6,12 +8,46 @@ import torch
 import wandb
 
 from .metas import CombinerAgent
-from .environment.env import step
+from .environment.env import step, initial_step
 from .environment.circuits import CircuitRepDQN, circuit_to_json
 from .environment.device import DeviceTopology
 from .environment.state import CircuitStateDQN
 from .visualizers.solution_validator import validate_solution
 
+_checkpoint_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+_checkpoint_lock = threading.Lock()
+_pending_checkpoint = None
+
+
+def _write_pending_checkpoint():
+    """
+    Writes out whatever snapshot is currently pending; no-ops when an earlier
+    task already wrote it, so stale writes collapse instead of queueing up
+    """
+    global _pending_checkpoint
+    with _checkpoint_lock:
+        pending, _pending_checkpoint = _pending_checkpoint, None
+    if pending is not None:
+        state_dict, path = pending
+        torch.save(state_dict, path)
+
+
+def save_checkpoint_async(model, path):
+    """
+    Writes a model checkpoint from a background thread, so serializing and
+    syncing it to disk does not stall the training loop. The state dict is
+    snapshotted to CPU tensors before handing off; when saves arrive faster
+    than they can be written, older pending snapshots are replaced by the
+    newest one, so the latest weights always reach disk.
+    :param model: torch.nn.Module, the model whose weights to save
+    :param path: str, where to write the checkpoint
+    """
+    global _pending_checkpoint
+    state_dict = {key: value.detach().cpu().clone() for key, value in model.state_dict().items()}
+    with _checkpoint_lock:
+        _pending_checkpoint = (state_dict, path)
+    _checkpoint_executor.submit(_write_pending_checkpoint)
+
 
 def train_step(agent: CombinerAgent,
                device: DeviceTopology,
@@ -25,7 +61,7 @@ def train_step(agent: CombinerAgent,
     solution_start, solution_moments = np.array(state.node_to_qubit), []
     progress_bar = tqdm.tqdm(total=len(list(circuit.cirq.all_operations())))
 
-    state, total_reward, done, debugging_output = step(np.full(len(state.device.edges), False), state)
+    total_reward, done, debugging_output = initial_step(state)
     progress_bar.update(len(debugging_output.cnots))
     solution_moments.append(debugging_output)
     if done:
@@ -47,7 +83,7 @@ def train_step(agent: CombinerAgent,
             loss_v, loss_p = agent.replay()
             if use_wandb:
                 wandb.log({'Value Loss': loss_v, 'Policy Loss': loss_p})
-            torch.save(agent.model.state_dict(), f"{device.name}-weights.h5")
+            save_checkpoint_async(agent.model, f"{device.name}-weights.h5")
 
         progress_bar.set_postfix(total_reward=total_reward, time=time)
         if done:
@@ -61,7 +97,7 @@ def train_step(agent: CombinerAgent,
                 loss_v, loss_p = agent.replay()
                 if use_wandb:
                     wandb.log({'Value Loss': loss_v, 'Policy Loss': loss_p})
-                torch.save(agent.model.state_dict(), f"{device.name}-weights.h5")
+                save_checkpoint_async(agent.model, f"{device.name}-weights.h5")
             if use_wandb:
                 wandb.log({'Circuit Depth': depth,
                            'Circuit Name': episode_name,
@@ -72,6 +108,6 @@ def train_step(agent: CombinerAgent,
         loss_v, loss_p = agent.replay()
         if use_wandb:
             wandb.log({'Value Loss': loss_v, 'Policy Loss': loss_p})
-        torch.save(agent.model.state_dict(), f"{device.name}-weights.h5")
+        save_checkpoint_async(agent.model, f"{device.name}-weights.h5")
 
     return solution_start, solution_moments, False
@@ -28,6 +28,12 @@ class CircuitRepDQN:
                 self.circuit[q2].append(q1)
             else:
                 raise ValueError('3 qubit primitives are not valid gates in the circuit')
+        # Dense views of the target lists: lengths per qubit, and the targets padded
+        # with -1 (one extra column so indexing by a completed progress gives -1)
+        self.lengths = np.array([len(targets) for targets in self.circuit], dtype=np.int16)
+        self.padded_targets = np.full((n_qubits, int(np.max(self.lengths, initial=0)) + 1), -1, dtype=np.int16)
+        for q, targets in enumerate(self.circuit):
+            self.padded_targets[q, :len(targets)] = targets
 
     def __getitem__(self, item: int):
         return self.circuit[item]
@@ -19,6 +19,8 @@ class DeviceTopology(cirq.Device):
         """
         self.name = name
         self.edges: typing.List[tuple] = edges
+        self.edges_array = np.asarray(edges, dtype=np.int32)
+        self.edges_n1, self.edges_n2 = self.edges_array[:, 0], self.edges_array[:, 1]
         self.nodes = nodes
         self.graph = nx.empty_graph(nodes)
         self.graph.add_edges_from(edges)
@@ -60,7 +62,7 @@ class DeviceTopology(cirq.Device):
         :param circuit: CircuitStateDQN object, represents the circuit to be allocated for
         :return: np.array, the resulting allocation
         """
-        return np.arange(len(circuit))
+        return np.arange(len(circuit), dtype=np.int16)
 
     def _get_distance_matrix(self, bidirectional=True):
         """
@@ -71,7 +73,7 @@ class DeviceTopology(cirq.Device):
 
         Note that unidirectional mode may not be supported fully through the rest of the code
         """
-        mat = np.full(fill_value=9999999, shape=(len(self), len(self)), dtype=np.int)
+        mat = np.full(fill_value=9999999, shape=(len(self), len(self)), dtype=np.int32)
         for bit in range(len(self)):
             mat[bit][bit] = 0
         for source, dest in self.graph.edges:
@@ -83,7 +85,8 @@ class DeviceTopology(cirq.Device):
                 for j in range(len(self)):
                     mat[i][j] = min(mat[i][j], mat[i][k] + mat[k][j])
         assert np.amax(mat) < 9999999, "The architecture is disconnected, run individually for components"
-        return mat
+        # int16 is plenty for shortest-path lengths and keeps the matrix cache-friendly
+        return mat.astype(np.int16)
 
     # Get the list of edges which can be swapped after given action
 
@@ -95,22 +98,15 @@ class DeviceTopology(cirq.Device):
         :param dummy_nodes: np.array, boolean array of the nodes, True if they have no operations left
         :return: list, edges which can still be swapped
         """
+        current_action = np.asarray(current_action, dtype=bool)
         if locked_edges is not None:
             current_action = np.bitwise_or(current_action, locked_edges)
-        available_edges_mask = np.full(shape=len(self.edges), fill_value=True)
-        current_action_nodes = set()
-        for i, used in enumerate(current_action):
-            if used:
-                (n1, n2) = self.edges[i]
-                current_action_nodes.add(n1)
-                current_action_nodes.add(n2)
-        for idx, edge in enumerate(self.edges):
-            if edge[0] in current_action_nodes or edge[1] in current_action_nodes:
-                available_edges_mask[idx] = False
+        current_action_nodes = self.edges_array[current_action].ravel()
+        available_edges_mask = np.bitwise_not(np.isin(self.edges_n1, current_action_nodes) |
+                                              np.isin(self.edges_n2, current_action_nodes))
         if dummy_nodes is not None:
-            for idx, edge in enumerate(self.edges):
-                if dummy_nodes[edge[0]] and dummy_nodes[edge[1]]:
-                    available_edges_mask[idx] = False
+            dummy_nodes = np.asarray(dummy_nodes, dtype=bool)
+            available_edges_mask &= np.bitwise_not(dummy_nodes[self.edges_n1] & dummy_nodes[self.edges_n2])
         return available_edges_mask
 
     # Methods to check if the circuit is working on the device without violating the Topology
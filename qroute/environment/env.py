@@ -10,19 +10,20 @@ from ..hyperparams import *
 Moment = collections.namedtuple('Moment', ['cnots', 'swaps', 'reward'])
 
 
-def step(action, input_state: CircuitStateDQN):
+def step(action, input_state: CircuitStateDQN, out=None):
     """
     Takes one step in the environment.
     This is actually the combination of 2 steps, the swaps in the current step and
     the cnot and setup for the next step.
     :param action: list of bool, whether we want to swap on each of the hardware connected nodes
     :param input_state: State, the state in the previous step
+    :param out: State, optional preallocated state whose buffers are reused for the output
     :return: state, the state in the upcoming step
     :return: reward, the reward obtained from the operations in the current step
     :return: done, True if execution is complete, False otherwise
     :return: debugging output, Moment containing the gates executed and the reward obtained
     """
-    state: CircuitStateDQN = copy.copy(input_state)
+    state: CircuitStateDQN = copy.copy(input_state) if out is None else input_state.copy_into(out)
     assert not np.any(np.bitwise_and(state.locked_edges, action)), "Bad Action"
     # Swaps the required qubits and collects rewards for the gain in distances
     pre_swap_distances = np.copy(state.target_distance)
@@ -48,6 +49,26 @@ def step(action, input_state: CircuitStateDQN):
     return state, reward, done, debugging_output
 
 
+def initial_step(input_state: CircuitStateDQN):
+    """
+    Executes the gates that are schedulable before any swaps are made, mutating the
+    input state in place. This replaces taking a full step with an all-False action
+    at the start of an episode, which paid for a state copy and the swap machinery
+    just to schedule the initially executable CNOTs.
+    :param input_state: State, the freshly constructed state for the episode
+    :return: reward, the reward obtained from the initially executable gates
+    :return: done, True if the whole circuit was executable as given
+    :return: debugging output, Moment containing the gates executed and the reward obtained
+    """
+    cnots_executed = input_state.execute_cnot()
+    cnot_action = np.array([gate in cnots_executed for gate in input_state.device.edges])
+    input_state.update_locks(cnot_action, 1)
+    done = input_state.is_done()
+    reward_completion = REWARD_CIRCUIT_COMPLETION if done else 0
+    reward = len(cnots_executed) * REWARD_GATE + reward_completion + REWARD_TIMESTEP
+    return reward, done, Moment(cnots_executed, [], reward)
+
+
 def evaluate(action, input_state: CircuitStateDQN):
     """
     Takes one step in the environment
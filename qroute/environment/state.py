@@ -28,14 +28,18 @@ class CircuitStateDQN:
         self.device = device
         assert len(circuit) == len(device), "All qubits on target device or not used, or too many are used"
         # The starting state should be setup right
-        self._node_to_qubit = self.device.allocate(self.circuit) \
-            if node_to_qubit is None else node_to_qubit
-        self._qubit_targets = np.array([targets[0] if len(targets) > 0 else -1 for targets in self.circuit.circuit]) \
+        # int16 indices and int8 locks are plenty for supported devices and keep the
+        # state compact, which matters since these arrays are copied every step
+        self._node_to_qubit = np.asarray(self.device.allocate(self.circuit), dtype=np.int16) \
+            if node_to_qubit is None else np.asarray(node_to_qubit, dtype=np.int16)
+        self._qubit_targets = np.copy(self.circuit.padded_targets[:, 0]) \
             if qubit_targets is None else qubit_targets
-        self._circuit_progress = np.zeros(len(self.circuit), dtype=np.int) \
+        self._circuit_progress = np.zeros(len(self.circuit), dtype=np.int16) \
             if circuit_progress is None else circuit_progress
-        self._locked_edges = np.zeros(len(self.device.edges), dtype=np.int) \
+        self._locked_edges = np.zeros(len(self.device.edges), dtype=np.int8) \
             if locked_edges is None else locked_edges
+        # Inverse of node_to_qubit, built lazily and invalidated when the mapping changes
+        self._qubit_to_node = None
 
     def execute_swap(self, solution):
         """
@@ -44,14 +48,12 @@ class CircuitStateDQN:
         :param solution: boolean np.array, whether to take each edge on the device
         :return list of pairs, pairs of nodes representing gates which will be executed
         """
-        gates_being_executed = []
-        for edge, sol in zip(self.device.edges, solution):
-            if sol:
-                node1, node2 = edge
-                gates_being_executed.append(edge)
-                self._node_to_qubit[node1], self._node_to_qubit[node2] = \
-                    self._node_to_qubit[node2], self._node_to_qubit[node1]
-        return gates_being_executed
+        swap_mask = np.asarray(solution, dtype=bool)
+        nodes_1, nodes_2 = self.device.edges_n1[swap_mask], self.device.edges_n2[swap_mask]
+        self._node_to_qubit[nodes_1], self._node_to_qubit[nodes_2] = \
+            self._node_to_qubit[nodes_2], self._node_to_qubit[nodes_1]
+        self._qubit_to_node = None
+        return list(zip(nodes_1.tolist(), nodes_2.tolist()))
 
     def execute_cnot(self):
         """
@@ -59,20 +61,26 @@ class CircuitStateDQN:
         This function MUTATES the state.
         :return list of pairs, pairs of nodes representing gates which will be executed
         """
-        gates_being_executed = []
-        for (n1, n2) in self.device.edges:
-            # Check if we want to execute CNOT on this edge
-            q1, q2 = self._node_to_qubit[n1], self._node_to_qubit[n2]
-            if self._qubit_targets[q1] != q2 or self._qubit_targets[q2] != q1:
-                continue
-            gates_being_executed.append((n1, n2))
-            # Increment the progress for both qubits by 1
-            self._circuit_progress[q1] += 1
-            self._circuit_progress[q2] += 1
-        # Updates the qubit targets
-        for q in range(len(self.device)):
-            self._qubit_targets[q] = self.circuit[q][self._circuit_progress[q]] \
-                if self._circuit_progress[q] < len(self.circuit[q]) else -1
+        # Find the edges whose qubits target each other and execute CNOTs on all of them.
+        # The two target checks are packed into one uint32 comparison per edge; a -1
+        # target wraps to 0xffff, which can never match a valid qubit index
+        qubits_1 = self._node_to_qubit[self.device.edges_n1]
+        qubits_2 = self._node_to_qubit[self.device.edges_n2]
+        target_pair = (self._qubit_targets[qubits_1].astype(np.uint16).astype(np.uint32) << 16) | \
+            self._qubit_targets[qubits_2].astype(np.uint16)
+        mapped_pair = (qubits_2.astype(np.uint16).astype(np.uint32) << 16) | qubits_1.astype(np.uint16)
+        cnot_mask = target_pair == mapped_pair
+        gates_being_executed = list(zip(self.device.edges_n1[cnot_mask].tolist(),
+                                        self.device.edges_n2[cnot_mask].tolist()))
+        # Increment the progress for both qubits of each gate by 1
+        self._circuit_progress[qubits_1[cnot_mask]] += 1
+        self._circuit_progress[qubits_2[cnot_mask]] += 1
+        # Updates the targets of just the qubits whose progress advanced, with a
+        # single gather on the padded target table (-1 padding marks completion)
+        if len(gates_being_executed) > 0:
+            changed_qubits = np.concatenate([qubits_1[cnot_mask], qubits_2[cnot_mask]])
+            self._qubit_targets[changed_qubits] = \
+                self.circuit.padded_targets[changed_qubits, self._circuit_progress[changed_qubits]]
         return gates_being_executed
 
     def is_done(self):
@@ -106,6 +114,23 @@ class CircuitStateDQN:
         return CircuitStateDQN(self.circuit, self.device, np.copy(self._node_to_qubit), np.copy(self._qubit_targets),
                                np.copy(self._circuit_progress), np.copy(self._locked_edges))
 
+    # noinspection PyProtectedMember
+    def copy_into(self, other):
+        """
+        Copies this state into an already allocated state object, reusing the
+        destination's array buffers instead of allocating fresh ones.
+
+        :param other: State, the destination state to overwrite
+        :return: State, the destination state
+        """
+        other.circuit, other.device = self.circuit, self.device
+        np.copyto(other._node_to_qubit, self._node_to_qubit)
+        np.copyto(other._qubit_targets, self._qubit_targets)
+        np.copyto(other._circuit_progress, self._circuit_progress)
+        np.copyto(other._locked_edges, self._locked_edges)
+        other._qubit_to_node = None
+        return other
+
     # noinspection PyProtectedMember
     def __eq__(self, other):
         """
@@ -114,10 +139,22 @@ class CircuitStateDQN:
         :param other: State, the other state to compare against
         :return: True if they are the same, False otherwise
         """
-        return np.array_equal(self._node_to_qubit, other._node_to_qubit) and \
-               np.array_equal(self._qubit_targets, other._qubit_targets) and \
-               np.array_equal(self._circuit_progress, other._circuit_progress) and \
-               np.array_equal(self._locked_edges, other._locked_edges)
+        return self._node_to_qubit.tobytes() == other._node_to_qubit.tobytes() and \
+               self._qubit_targets.tobytes() == other._qubit_targets.tobytes() and \
+               self._circuit_progress.tobytes() == other._circuit_progress.tobytes() and \
+               self._locked_edges.tobytes() == other._locked_edges.tobytes()
+
+    def _get_qubit_to_node(self):
+        """
+        Computes the inverse of the node_to_qubit map, rebuilding it only
+        when the mapping has changed since the last call
+        :return: np.array, node at which each qubit is present
+        """
+        if self._qubit_to_node is None:
+            qubit_to_node = np.empty_like(self._node_to_qubit)
+            qubit_to_node[self._node_to_qubit] = np.arange(len(self._node_to_qubit))
+            self._qubit_to_node = qubit_to_node
+        return self._qubit_to_node
 
     @property
     def target_nodes(self):
@@ -125,13 +162,10 @@ class CircuitStateDQN:
         For each node, returns the target node in the current timestep
         :return: np.array, list of target nodes or -1 if no target
         """
-        qubit_to_node = np.zeros(len(self._node_to_qubit), dtype=np.int)
-        for i, v in enumerate(self._node_to_qubit):
-            qubit_to_node[v] = i
+        qubit_to_node = self._get_qubit_to_node()
         target_nodes = np.full(shape=len(self._node_to_qubit), fill_value=-1)
-        for i, v in enumerate(self._qubit_targets):
-            if v != -1:
-                target_nodes[qubit_to_node[i]] = qubit_to_node[v]
+        valid_targets = self._qubit_targets >= 0
+        target_nodes[qubit_to_node[valid_targets]] = qubit_to_node[self._qubit_targets[valid_targets]]
         return target_nodes
 
     @property
@@ -140,12 +174,11 @@ class CircuitStateDQN:
         For each node, returns the distance from each node to it's target
         :return: np.array, list of shortest distances on device to the next targets, 0 if no target
         """
-        qubit_to_node = np.zeros(len(self._node_to_qubit), dtype=np.int)
-        for i, v in enumerate(self._node_to_qubit):
-            qubit_to_node[v] = i
-        target_distances = np.zeros(len(self._node_to_qubit), dtype=np.int)
-        for i, v in enumerate(self._qubit_targets):
-            target_distances[i] = self.device.distances[qubit_to_node[i], qubit_to_node[v]]
+        qubit_to_node = self._get_qubit_to_node()
+        valid_targets = self._qubit_targets >= 0
+        target_distances = np.zeros(len(self._node_to_qubit), dtype=self.device.distances.dtype)
+        target_distances[valid_targets] = self.device.distances[
+            qubit_to_node[valid_targets], qubit_to_node[self._qubit_targets[valid_targets]]]
         return target_distances
 
     @property
@@ -154,13 +187,7 @@ class CircuitStateDQN:
         Number of targets left
         :return: np.array, number of targets left for each node
         """
-        qubit_to_node = np.zeros(len(self._node_to_qubit), dtype=np.int)
-        for i, v in enumerate(self._node_to_qubit):
-            qubit_to_node[v] = i
-        remaining_targets = np.zeros(len(self._node_to_qubit), dtype=np.int)
-        for i, v in enumerate(self._circuit_progress):
-            remaining_targets[i] = len(self.circuit[i]) - v
-        return remaining_targets
+        return self.circuit.lengths - self._circuit_progress
 
     @property
     def node_to_qubit(self):
@@ -176,7 +203,4 @@ class CircuitStateDQN:
         Node to Qubit mapping
         :return: np.array, qubit present at each given node
         """
-        qubit_to_node = np.zeros(len(self._node_to_qubit), dtype=np.int)
-        for i, v in enumerate(self._node_to_qubit):
-            qubit_to_node[v] = i
-        return qubit_to_node
+        return np.copy(self._get_qubit_to_node())
@@ -1,26 +1,52 @@
 import numpy as np
+import torch
+
 from ..metas import ReplayMemory
+from ..hyperparams import DEVICE
 
 
 class MemorySimple(ReplayMemory):
+    """
+    Replay buffer keeping each field of the stored experiences in its own list
+    (structure of arrays rather than a list of tuples), so that minibatches can
+    be stacked into contiguous tensors and shipped to the compute device in one
+    transfer instead of tuple-at-a-time.
+    """
 
     def __init__(self, _capacity):
-        self.data = []
+        self.states = []
+        self.values = []
+        self.policies = []
 
-    def store(self, *args):
-        self.data.append(args)
+    def store(self, state, value, policy):
+        self.states.append(state)
+        self.values.append(value)
+        self.policies.append(policy)
 
     def __getitem__(self, item):
-        return self.data[item]
+        return self.states[item], self.values[item], self.policies[item]
 
     def sample(self, batch_size=1):
-        return np.random.choice(self.data, size=batch_size)
+        """
+        Gets a random minibatch with the value and policy targets stacked into
+        contiguous tensors; on CUDA devices the batch is staged through pinned
+        host memory so the copy overlaps compute via non_blocking transfers
+        :param batch_size: number of experiences to sample
+        :return: (states, values, policies), list of states and stacked tensors
+        """
+        indices = np.random.randint(len(self.states), size=batch_size)
+        values = torch.stack([self.values[index] for index in indices])
+        policies = torch.stack([self.policies[index] for index in indices])
+        if torch.cuda.is_available() and DEVICE != 'cpu':
+            values = values.pin_memory().to(DEVICE, non_blocking=True)
+            policies = policies.pin_memory().to(DEVICE, non_blocking=True)
+        return [self.states[index] for index in indices], values, policies
 
     def __len__(self):
-        return len(self.data)
+        return len(self.states)
 
     def __iter__(self):
-        return iter(self.data)
+        return iter(zip(self.states, self.values, self.policies))
 
     def clear(self):
-        self.data = []
+        self.states, self.values, self.policies = [], [], []
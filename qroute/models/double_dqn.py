@@ -56,12 +56,17 @@ class DoubleDQNAgent(torch.nn.Module):
         Get the value function approximations for the given state representation
 
         :param current_state: the current state
-        :param next_state: the next state as a result of the action
+        :param next_state: the next state as a result of the action, or a list of
+                           candidate next states to evaluate in a single batched call
         :param action_chooser: str, model if current model or target if target model
         :return: int/float, the value function approximation
         """
         current_distance_vector = self.get_distance_metric(current_state)
-        next_distance_vector = self.get_distance_metric(next_state)
+        if isinstance(next_state, (list, tuple)):
+            next_distance_vector = torch.stack([self.get_distance_metric(state) for state in next_state])
+            current_distance_vector = current_distance_vector.expand(len(next_state), -1)
+        else:
+            next_distance_vector = self.get_distance_metric(next_state)
 
         nn_input = torch.cat([current_distance_vector, next_distance_vector], dim=-1)
 
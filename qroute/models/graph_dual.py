@@ -29,6 +29,7 @@ class GraphDualModel(torch.nn.Module):
         """
         super(GraphDualModel, self).__init__()
         self.device = device
+        self.stop_move = stop_move
         mlp = torch.nn.Sequential(
             torch.nn.Linear(len(self.device) * 2, 50),
             torch.nn.SiLU(),
@@ -69,6 +70,26 @@ class GraphDualModel(torch.nn.Module):
         # policy[-1] = -1e10  FIXME: Force this constraint for all other functions
         return value, policy
 
+    def forward_batch(self, states: typing.List[CircuitStateDQN]):
+        """
+        Does the forward propagation step for several states in one call, stacking
+        them into a single disjoint graph so the convolution and the output heads
+        each launch once for the whole batch
+        :param states: list of input states of the circuit
+        :return: list of (value, policy) outputs, one per input state
+        """
+        n_nodes, n_graph_edges = len(self.device), self.edges.shape[1]
+        representations = [self.get_representation(state) for state in states]
+        x = torch.cat([rep[0] for rep in representations], dim=0)
+        edge_offsets = torch.arange(len(states)).repeat_interleave(n_graph_edges) * n_nodes
+        x = self.edge_conv(x, self.edges.repeat(1, len(states)) + edge_offsets)
+        x = x.reshape(len(states), -1)
+        remaining = torch.stack([rep[1] for rep in representations])
+        locks = torch.stack([rep[2] for rep in representations])
+        policy = self.policy_head(torch.cat([x, locks], dim=-1))
+        value = self.value_head(torch.cat([x, remaining, locks], dim=-1))
+        return [(value[i], policy[i]) for i in range(len(states))]
+
     def get_representation(self, state: CircuitStateDQN):
         """
         Obtains the state representation
@@ -56,13 +56,10 @@ def check_valid_solution(solution, device):
     """
     if not np.any(solution):
         return
-    swap_edge_indices = np.where(np.array(solution) == 1)[0]
-    swap_edges = [device.edges[index] for index in swap_edge_indices]
-    swap_nodes = [node for edge in swap_edges for node in edge]
+    swap_edges = device.edges_array[np.asarray(solution, dtype=bool)]
+    swap_nodes = swap_edges.ravel()
 
-    # return False if repeated swap nodes
-    seen = set()
-    for node in swap_nodes:
-        if node in seen:
-            raise RuntimeError('Solution is not safe: A node has several ops - %s' % str(swap_edges))
-        seen.add(node)
+    # raise if repeated swap nodes
+    if np.unique(swap_nodes).size != swap_nodes.size:
+        raise RuntimeError('Solution is not safe: A node has several ops - %s' %
+                           str([tuple(edge) for edge in swap_edges]))
@@ -0,0 +1,21 @@
+import numpy as np
+
+import qroute
+
+
+def test_root_parallel_search():
+    cirq_circuit = qroute.environment.circuits.circuit_generated_full_layer(4, 1)
+    circuit = qroute.environment.circuits.CircuitRepDQN(cirq_circuit)
+    device = qroute.environment.device.GridComputerDevice(2, 2)
+    model = qroute.models.graph_dual.GraphDualModel(device, True)
+    memory = qroute.memory.list.MemorySimple(500)
+    agent = qroute.algorithms.deepmcts.MCTSAgent(model, device, memory, search_depth=8, n_jobs=2)
+    # Start from a state where no gate is immediately schedulable, so acting requires a search
+    state = qroute.environment.state.CircuitStateDQN(circuit, device, node_to_qubit=np.array([0, 3, 2, 1]))
+    qroute.environment.env.initial_step(state)
+    action = agent.act(state)
+    assert len(action) == len(device.edges), "Action does not cover the device edges"
+    assert not np.any(np.bitwise_and(state.locked_edges, action)), "Action uses locked edges"
+    assert len(memory) > 0, "Search results were not stored for replay"
+    _state, _value, policy = memory[0]
+    assert abs(float(policy.sum()) - 1.0) < 1e-4, "Stored policy is not a distribution"